@@ -1,20 +1,38 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, status
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
 import os
 import logging
 from pathlib import Path
 import json
 import asyncio
+import bisect
+import heapq
+import calendar
+import hmac
+import string
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from collections import Counter
 from pydantic import BaseModel, Field, EmailStr
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
 import bcrypt
 import jwt
+from jwt.algorithms import HMACAlgorithm
+from jwt.utils import base64url_decode
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib json fallback
+    orjson = None
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
@@ -25,7 +43,62 @@ load_dotenv(ROOT_DIR / '.env')
 logger = logging.getLogger(__name__)
 
 
+class _UserLocks:
+    # One lock per user for score updates; entries are dropped once nobody holds or waits on them.
+    def __init__(self):
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def for_user(self, user_id: str):
+        lock, refs = self._locks.get(user_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[user_id] = (lock, refs + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, refs = self._locks[user_id]
+            if refs <= 1:
+                del self._locks[user_id]
+            else:
+                self._locks[user_id] = (lock, refs - 1)
+
+
+class _TTLCache:
+    # Small in-process cache: entries expire after `ttl` seconds; the oldest entry is evicted when full.
+    def __init__(self, maxsize: int, ttl: float):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data: Dict[Any, Tuple[float, Any]] = {}
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        if key not in self._data and len(self._data) >= self._maxsize:
+            now = time.monotonic()
+            for stale in [k for k, (expires_at, _) in self._data.items() if expires_at <= now]:
+                del self._data[stale]
+            if len(self._data) >= self._maxsize:
+                del self._data[next(iter(self._data))]
+        self._data[key] = (time.monotonic() + self._ttl, value)
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+
+# Guards the weekly reset/rollover; per-user score updates use user_score_locks.
 leaderboard_lock = asyncio.Lock()
+user_score_locks = _UserLocks()
 leaderboard_scheduler: Optional[AsyncIOScheduler] = None
 
 
@@ -36,28 +109,49 @@ class _InMemoryResult:
 
 
 def _apply_projection(doc: Dict[str, Any], projection: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    # When nothing is excluded the stored doc itself is returned; callers treat results as read-only.
     if not projection:
-        return dict(doc)
-    # This codebase only uses exclusion projections like {"_id": 0, "password": 0}
+        return doc
+    included_keys = [k for k, v in projection.items() if v]
+    if included_keys:
+        # Inclusion projection like {"_id": 0, "date": 1, "status": 1}
+        return {k: doc[k] for k in included_keys if k in doc}
+    # Exclusion projection like {"_id": 0, "password": 0}
     excluded_keys = {k for k, v in projection.items() if v == 0}
+    if not any(k in doc for k in excluded_keys):
+        return doc
     return {k: v for k, v in doc.items() if k not in excluded_keys}
 
 
-def _match_filter(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+def _compile_matcher(query: Dict[str, Any]) -> Callable[[Dict[str, Any]], bool]:
+    # Interpret the query once and return a predicate that is applied per document.
+    predicates: List[Callable[[Dict[str, Any]], bool]] = []
     for key, expected in query.items():
         if isinstance(expected, dict):
-            value = doc.get(key)
             gte = expected.get("$gte")
             lte = expected.get("$lte")
-            if gte is not None and (value is None or value < gte):
-                return False
-            if lte is not None and (value is None or value > lte):
-                return False
+            if gte is not None and lte is not None:
+                predicates.append(lambda d, k=key, g=gte, l=lte: (v := d.get(k)) is not None and g <= v <= l)
+            elif gte is not None:
+                predicates.append(lambda d, k=key, g=gte: (v := d.get(k)) is not None and v >= g)
+            elif lte is not None:
+                predicates.append(lambda d, k=key, l=lte: (v := d.get(k)) is not None and v <= l)
             continue
 
-        if doc.get(key) != expected:
-            return False
-    return True
+        predicates.append(lambda d, k=key, e=expected: d.get(k) == e)
+
+    if not predicates:
+        return lambda d: True
+    if len(predicates) == 1:
+        return predicates[0]
+
+    def match(doc: Dict[str, Any]) -> bool:
+        for predicate in predicates:
+            if not predicate(doc):
+                return False
+        return True
+
+    return match
 
 
 class _InMemoryCursor:
@@ -65,38 +159,220 @@ class _InMemoryCursor:
         self._docs = docs
         self._projection = projection
         self._sort: Optional[Tuple[str, int]] = None
+        self._skip = 0
+        self._limit = 0
 
     def sort(self, field: str, direction: int):
         self._sort = (field, direction)
         return self
 
-    async def to_list(self, length: int) -> List[Dict[str, Any]]:
-        docs = list(self._docs)
+    def skip(self, count: int):
+        self._skip = max(0, count)
+        return self
+
+    def limit(self, count: int):
+        self._limit = max(0, count)
+        return self
+
+    async def to_list(self, length: Optional[int]) -> List[Dict[str, Any]]:
+        if length is None:
+            length = len(self._docs)
+        if self._limit:
+            length = min(length, self._limit)
+        end = self._skip + length
+
         if self._sort is not None:
             field, direction = self._sort
             reverse = direction == -1
-            docs.sort(key=lambda d: d.get(field), reverse=reverse)
 
-        limited = docs[:length]
-        return [_apply_projection(d, self._projection) for d in limited]
+            def key(d: Dict[str, Any]) -> Tuple[bool, Any]:
+                # Missing/None sorts lowest, as in MongoDB, and is never compared with real values.
+                value = d.get(field)
+                return (False, 0) if value is None else (True, value)
+
+            if end < len(self._docs):
+                # Only the top `skip + length` docs are needed; a bounded heap beats sorting everything.
+                pick = heapq.nlargest if reverse else heapq.nsmallest
+                limited = pick(end, self._docs, key=key)
+            else:
+                limited = sorted(self._docs, key=key, reverse=reverse)
+        else:
+            limited = self._docs[:end]
+
+        return [_apply_projection(d, self._projection) for d in limited[self._skip:]]
+
+
+# Equality lookups on these fields are served from hash indexes instead of scanning every document.
+# Each entry is (unique fields, non-unique fields, compound (equality field, range field) pairs).
+# A compound index keeps each equality value's docs sorted by the range field, so queries like
+# {"user_id": ..., "date": {"$gte": ..., "$lte": ...}} read just the matching slice.
+_COLLECTION_INDEXES: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[Tuple[str, str], ...]]] = {
+    "users": (("id", "email"), (), ()),
+    "habits": (("id",), ("user_id",), ()),
+    "habit_logs": (("id",), ("user_id", "habit_id"), (("habit_id", "date"), ("user_id", "date"))),
+}
+
+
+class _DocIndexes:
+    def __init__(
+        self,
+        unique: Tuple[str, ...] = (),
+        multi: Tuple[str, ...] = (),
+        compound: Tuple[Tuple[str, str], ...] = (),
+    ):
+        self._unique: Dict[str, Dict[Any, Dict[str, Any]]] = {k: {} for k in unique}
+        self._multi: Dict[str, Dict[Any, List[Dict[str, Any]]]] = {k: {} for k in multi}
+        # (eq_field, range_field) -> eq value -> (sorted range values, docs in the same order)
+        self._compound: Dict[Tuple[str, str], Dict[Any, Tuple[List[Any], List[Dict[str, Any]]]]] = {
+            k: {} for k in compound
+        }
+        self._fields = set(unique) | set(multi) | {f for pair in compound for f in pair}
+
+    @classmethod
+    def for_collection(cls, name: str) -> "_DocIndexes":
+        unique, multi, compound = _COLLECTION_INDEXES.get(name, ((), (), ()))
+        return cls(unique, multi, compound)
+
+    def rebuild(self, docs: List[Dict[str, Any]]) -> None:
+        for index in self._unique.values():
+            index.clear()
+        for index in self._multi.values():
+            index.clear()
+        for index in self._compound.values():
+            index.clear()
+        for doc in docs:
+            self.add(doc)
+
+    def add(self, doc: Dict[str, Any]) -> None:
+        for key, index in self._unique.items():
+            value = doc.get(key)
+            if value is not None:
+                index.setdefault(value, doc)
+        for key, index in self._multi.items():
+            value = doc.get(key)
+            if value is not None:
+                index.setdefault(value, []).append(doc)
+        for (eq_field, range_field), index in self._compound.items():
+            value, position = doc.get(eq_field), doc.get(range_field)
+            if value is not None and position is not None:
+                positions, docs = index.setdefault(value, ([], []))
+                i = bisect.bisect_right(positions, position)
+                positions.insert(i, position)
+                docs.insert(i, doc)
+
+    def remove(self, doc: Dict[str, Any]) -> None:
+        for key, index in self._unique.items():
+            value = doc.get(key)
+            if value is not None and index.get(value) is doc:
+                del index[value]
+        for key, index in self._multi.items():
+            value = doc.get(key)
+            bucket = index.get(value) if value is not None else None
+            if not bucket:
+                continue
+            for i, candidate in enumerate(bucket):
+                if candidate is doc:
+                    del bucket[i]
+                    break
+            if not bucket:
+                del index[value]
+        for (eq_field, range_field), index in self._compound.items():
+            value, position = doc.get(eq_field), doc.get(range_field)
+            entry = index.get(value) if value is not None and position is not None else None
+            if not entry:
+                continue
+            positions, docs = entry
+            for i in range(bisect.bisect_left(positions, position), bisect.bisect_right(positions, position)):
+                if docs[i] is doc:
+                    del positions[i]
+                    del docs[i]
+                    break
+            if not positions:
+                del index[value]
+
+    def update(self, doc: Dict[str, Any], changes: Dict[str, Any]) -> None:
+        if not any(k in self._fields for k in changes):
+            doc.update(changes)
+            return
+        self.remove(doc)
+        doc.update(changes)
+        self.add(doc)
+
+    def candidates(self, query: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        # Returns the docs that can possibly match, or None when no index applies.
+        for key, index in self._unique.items():
+            expected = query.get(key)
+            if expected is not None and not isinstance(expected, dict):
+                doc = index.get(expected)
+                return [doc] if doc is not None else []
+        for (eq_field, range_field), index in self._compound.items():
+            expected, bound = query.get(eq_field), query.get(range_field)
+            if expected is None or isinstance(expected, dict) or bound is None:
+                continue
+            if isinstance(bound, dict):
+                low, high = bound.get("$gte"), bound.get("$lte")
+                if low is None and high is None:
+                    continue
+            else:
+                low = high = bound
+            entry = index.get(expected)
+            if entry is None:
+                return []
+            positions, docs = entry
+            start = bisect.bisect_left(positions, low) if low is not None else 0
+            end = bisect.bisect_right(positions, high) if high is not None else len(positions)
+            return docs[start:end]
+        # Several equality fields can be indexed (habit_logs: user_id and habit_id); scan the
+        # smallest bucket, e.g. one habit's logs rather than all of the user's.
+        best: Optional[List[Dict[str, Any]]] = None
+        for key, index in self._multi.items():
+            expected = query.get(key)
+            if expected is not None and not isinstance(expected, dict):
+                bucket = index.get(expected, [])
+                if best is None or len(bucket) < len(best):
+                    best = bucket
+        return best
+
+
+def _remove_by_identity(docs: List[Dict[str, Any]], doc: Dict[str, Any]) -> None:
+    for i, candidate in enumerate(docs):
+        if candidate is doc:
+            del docs[i]
+            return
 
 
 class _InMemoryCollection:
-    def __init__(self):
+    def __init__(self, indexes: Optional[_DocIndexes] = None):
         self._docs: List[Dict[str, Any]] = []
+        self._indexes = indexes or _DocIndexes()
+
+    def _candidates(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        indexed = self._indexes.candidates(query)
+        return self._docs if indexed is None else indexed
 
     async def find_one(self, query: Dict[str, Any], projection: Optional[Dict[str, int]] = None):
-        for doc in self._docs:
-            if _match_filter(doc, query):
+        matches = _compile_matcher(query)
+        for doc in self._candidates(query):
+            if matches(doc):
                 return _apply_projection(doc, projection)
         return None
 
     async def insert_one(self, doc: Dict[str, Any]):
-        self._docs.append(dict(doc))
+        stored = dict(doc)
+        self._docs.append(stored)
+        self._indexes.add(stored)
         return _InMemoryResult(matched_count=1)
 
+    async def insert_many(self, docs: List[Dict[str, Any]], ordered: bool = True):
+        for doc in docs:
+            stored = dict(doc)
+            self._docs.append(stored)
+            self._indexes.add(stored)
+        return _InMemoryResult(matched_count=len(docs))
+
     def find(self, query: Dict[str, Any], projection: Optional[Dict[str, int]] = None) -> _InMemoryCursor:
-        matched = [d for d in self._docs if _match_filter(d, query)]
+        matches = _compile_matcher(query)
+        matched = [d for d in self._candidates(query) if matches(d)]
         return _InMemoryCursor(matched, projection)
 
     async def update_one(self, query: Dict[str, Any], update: Dict[str, Any]):
@@ -104,40 +380,54 @@ class _InMemoryCollection:
         if not isinstance(update_set, dict):
             return _InMemoryResult(matched_count=0)
 
-        for doc in self._docs:
-            if _match_filter(doc, query):
-                doc.update(update_set)
+        matches = _compile_matcher(query)
+        for doc in self._candidates(query):
+            if matches(doc):
+                self._indexes.update(doc, update_set)
                 return _InMemoryResult(matched_count=1)
         return _InMemoryResult(matched_count=0)
 
     async def delete_one(self, query: Dict[str, Any]):
-        for i, doc in enumerate(self._docs):
-            if _match_filter(doc, query):
-                del self._docs[i]
+        matches = _compile_matcher(query)
+        for doc in self._candidates(query):
+            if matches(doc):
+                self._indexes.remove(doc)
+                _remove_by_identity(self._docs, doc)
                 return _InMemoryResult(deleted_count=1)
         return _InMemoryResult(deleted_count=0)
 
     async def delete_many(self, query: Dict[str, Any]):
+        matches = _compile_matcher(query)
         before = len(self._docs)
-        self._docs = [d for d in self._docs if not _match_filter(d, query)]
+        kept: List[Dict[str, Any]] = []
+        for doc in self._docs:
+            if matches(doc):
+                self._indexes.remove(doc)
+            else:
+                kept.append(doc)
+        self._docs = kept
         return _InMemoryResult(deleted_count=before - len(self._docs))
 
 
 class InMemoryDB:
     def __init__(self):
-        self.users = _InMemoryCollection()
-        self.habits = _InMemoryCollection()
-        self.habit_logs = _InMemoryCollection()
-        self.weekly_scores = _InMemoryCollection()
-        self.weekly_history = _InMemoryCollection()
-        self.meta = _InMemoryCollection()
+        self.users = _InMemoryCollection(_DocIndexes.for_collection("users"))
+        self.habits = _InMemoryCollection(_DocIndexes.for_collection("habits"))
+        self.habit_logs = _InMemoryCollection(_DocIndexes.for_collection("habit_logs"))
+        self.weekly_scores = _InMemoryCollection(_DocIndexes.for_collection("weekly_scores"))
+        self.weekly_history = _InMemoryCollection(_DocIndexes.for_collection("weekly_history"))
+        self.meta = _InMemoryCollection(_DocIndexes.for_collection("meta"))
 
 
 class FileBackedDB:
-    def __init__(self, path: Path):
+    def __init__(self, path: Path, flush_delay: float = 0.05):
         self._path = Path(path)
         self._path.parent.mkdir(parents=True, exist_ok=True)
         self._lock = asyncio.Lock()
+        # Writes mark the DB dirty; a single delayed flush rewrites the file for the whole burst.
+        self._flush_delay = flush_delay
+        self._dirty = False
+        self._flush_task: Optional[asyncio.Task] = None
         self._data: Dict[str, List[Dict[str, Any]]] = {
             "users": [],
             "habits": [],
@@ -146,6 +436,7 @@ class FileBackedDB:
             "weekly_history": [],
             "meta": [],
         }
+        self._indexes: Dict[str, _DocIndexes] = {key: _DocIndexes.for_collection(key) for key in self._data}
         self._load_from_disk()
 
         self.users = _FileBackedCollection(self, "users")
@@ -159,8 +450,13 @@ class FileBackedDB:
         if not self._path.exists():
             return
         try:
-            raw = self._path.read_text(encoding="utf-8")
-            loaded = json.loads(raw) if raw.strip() else {}
+            raw = self._path.read_bytes()
+            if not raw.strip():
+                loaded = {}
+            elif orjson is not None:
+                loaded = orjson.loads(raw)
+            else:
+                loaded = json.loads(raw.decode("utf-8"))
             if isinstance(loaded, dict):
                 for key in ("users", "habits", "habit_logs", "weekly_scores", "weekly_history", "meta"):
                     value = loaded.get(key)
@@ -169,37 +465,87 @@ class FileBackedDB:
         except Exception as e:
             logger.warning("Failed to load file-backed DB (%s). Starting empty.", str(e))
 
+        for key, indexes in self._indexes.items():
+            indexes.rebuild(self._data[key])
+
     async def _save_to_disk(self) -> None:
         tmp_path = self._path.with_suffix(self._path.suffix + ".tmp")
-        payload = json.dumps(self._data, ensure_ascii=False, separators=(",", ":"))
-        tmp_path.write_text(payload, encoding="utf-8")
+        if orjson is not None:
+            tmp_path.write_bytes(orjson.dumps(self._data))
+        else:
+            payload = json.dumps(self._data, ensure_ascii=False, separators=(",", ":"))
+            tmp_path.write_text(payload, encoding="utf-8")
         os.replace(tmp_path, self._path)
 
+    def _schedule_flush(self) -> None:
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_after(self._flush_delay))
+
+    async def _flush_after(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Failed to flush file-backed DB to %s", str(self._path))
+            self._dirty = True
+
+    async def flush(self) -> None:
+        # Await this when a write must be on disk before continuing (e.g. on shutdown).
+        task = self._flush_task
+        if task is not None and task is not asyncio.current_task() and not task.done():
+            task.cancel()
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            await self._save_to_disk()
+
 
 class _FileBackedCollection:
     def __init__(self, db: FileBackedDB, key: str):
         self._db = db
         self._key = key
+        self._indexes = db._indexes[key]
 
     def _docs(self) -> List[Dict[str, Any]]:
         return self._db._data[self._key]
 
+    def _candidates(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        indexed = self._indexes.candidates(query)
+        return self._docs() if indexed is None else indexed
+
     async def find_one(self, query: Dict[str, Any], projection: Optional[Dict[str, int]] = None):
-        async with self._db._lock:
-            for doc in self._docs():
-                if _match_filter(doc, query):
-                    return _apply_projection(doc, projection)
+        # Reads never await mid-scan, so on the event loop they can't observe a half-applied write;
+        # only writers (and the flush) take the lock.
+        matches = _compile_matcher(query)
+        for doc in self._candidates(query):
+            if matches(doc):
+                return _apply_projection(doc, projection)
         return None
 
     async def insert_one(self, doc: Dict[str, Any]):
+        stored = dict(doc)
         async with self._db._lock:
-            self._docs().append(dict(doc))
-            await self._db._save_to_disk()
+            self._docs().append(stored)
+            self._indexes.add(stored)
+            self._db._schedule_flush()
         return _InMemoryResult(matched_count=1)
 
+    async def insert_many(self, docs: List[Dict[str, Any]], ordered: bool = True):
+        stored_docs = [dict(doc) for doc in docs]
+        async with self._db._lock:
+            for stored in stored_docs:
+                self._docs().append(stored)
+                self._indexes.add(stored)
+            if stored_docs:
+                self._db._schedule_flush()
+        return _InMemoryResult(matched_count=len(stored_docs))
+
     def find(self, query: Dict[str, Any], projection: Optional[Dict[str, int]] = None) -> _InMemoryCursor:
-        # Cursor is consumed later; keep it independent of future mutations.
-        matched = [dict(d) for d in self._docs() if _match_filter(d, query)]
+        # The cursor holds the stored docs themselves (read-only by convention, like find_one results).
+        matches = _compile_matcher(query)
+        matched = [d for d in self._candidates(query) if matches(d)]
         return _InMemoryCursor(matched, projection)
 
     async def update_one(self, query: Dict[str, Any], update: Dict[str, Any]):
@@ -207,30 +553,40 @@ class _FileBackedCollection:
         if not isinstance(update_set, dict):
             return _InMemoryResult(matched_count=0)
 
+        matches = _compile_matcher(query)
         async with self._db._lock:
-            for doc in self._docs():
-                if _match_filter(doc, query):
-                    doc.update(update_set)
-                    await self._db._save_to_disk()
+            for doc in self._candidates(query):
+                if matches(doc):
+                    self._indexes.update(doc, update_set)
+                    self._db._schedule_flush()
                     return _InMemoryResult(matched_count=1)
         return _InMemoryResult(matched_count=0)
 
     async def delete_one(self, query: Dict[str, Any]):
+        matches = _compile_matcher(query)
         async with self._db._lock:
-            for i, doc in enumerate(self._docs()):
-                if _match_filter(doc, query):
-                    del self._docs()[i]
-                    await self._db._save_to_disk()
+            for doc in self._candidates(query):
+                if matches(doc):
+                    self._indexes.remove(doc)
+                    _remove_by_identity(self._docs(), doc)
+                    self._db._schedule_flush()
                     return _InMemoryResult(deleted_count=1)
         return _InMemoryResult(deleted_count=0)
 
     async def delete_many(self, query: Dict[str, Any]):
+        matches = _compile_matcher(query)
         async with self._db._lock:
             before = len(self._docs())
-            self._db._data[self._key] = [d for d in self._docs() if not _match_filter(d, query)]
-            deleted = before - len(self._db._data[self._key])
+            kept: List[Dict[str, Any]] = []
+            for doc in self._docs():
+                if matches(doc):
+                    self._indexes.remove(doc)
+                else:
+                    kept.append(doc)
+            self._db._data[self._key] = kept
+            deleted = before - len(kept)
             if deleted:
-                await self._db._save_to_disk()
+                self._db._schedule_flush()
         return _InMemoryResult(deleted_count=deleted)
 
 
@@ -249,8 +605,12 @@ JWT_SECRET_SOURCE = "env" if _jwt_secret_env else "default"
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
-# Create the main app without a prefix
-app = FastAPI()
+# HS256 verifier with the key prepared once, used on every authenticated request.
+_JWT_HS256 = HMACAlgorithm(HMACAlgorithm.SHA256)
+_JWT_SIGNING_KEY = _JWT_HS256.prepare_key(JWT_SECRET)
+
+# Create the main app without a prefix (responses are encoded with orjson when it's installed)
+app = FastAPI(default_response_class=ORJSONResponse if orjson is not None else JSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -383,9 +743,52 @@ def create_access_token(user_id: str, email: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def _json_loads(raw: bytes) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    # Equivalent to jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM]) for the tokens issued
+    # by create_access_token, without re-resolving the algorithm and key on every call.
+    if token.count(".") != 2:
+        raise jwt.DecodeError("Not enough segments")
+    try:
+        signing_input, _, signature_segment = token.rpartition(".")
+        header_segment, _, payload_segment = signing_input.partition(".")
+        header = _json_loads(base64url_decode(header_segment))
+        payload = _json_loads(base64url_decode(payload_segment))
+        signature = base64url_decode(signature_segment)
+    except Exception as e:
+        raise jwt.DecodeError("Invalid token segments") from e
+    if not isinstance(header, dict) or not isinstance(payload, dict):
+        raise jwt.DecodeError("Invalid token segments")
+    if header.get("alg") != JWT_ALGORITHM:
+        raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+    if not _JWT_HS256.verify(signing_input.encode("utf-8"), _JWT_SIGNING_KEY, signature):
+        raise jwt.InvalidSignatureError("Signature verification failed")
+
+    exp = payload.get("exp")
+    if exp is not None:
+        if not isinstance(exp, (int, float)) or isinstance(exp, bool):
+            raise jwt.DecodeError("Expiration Time claim (exp) must be an integer.")
+        if exp <= datetime.now(timezone.utc).timestamp():
+            raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
+# Verified token -> (user doc, token exp). Saves the decode and the users lookup on repeat requests.
+# User docs are only ever inserted (registration), so entries cannot go stale; a route that
+# edits or deletes users must evict that user's entries here.
+_USER_CACHE = _TTLCache(maxsize=10_000, ttl=60)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    cached = _USER_CACHE.get(token)
+    if cached is not None:
+        user, exp = cached
+        if exp is None or exp > datetime.now(timezone.utc).timestamp():
+            return user
+        _USER_CACHE.pop(token)
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = decode_access_token(token)
         user_id = payload.get("user_id")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
@@ -393,12 +796,27 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
+        _USER_CACHE[token] = (user, payload.get("exp"))
         return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# ============== RESPONSE CACHE ==============
+
+# Short-lived cache for the read endpoints the frontend polls (habit list, analytics).
+# Keys include a per-user generation that every habit/log write bumps, so a write invalidates
+# all of that user's cached responses at once; old entries simply age out.
+_RESPONSE_CACHE = _TTLCache(maxsize=10_000, ttl=5)
+_response_generations: Dict[str, int] = {}
+
+def _response_cache_key(user_id: str, endpoint: str, request: Request) -> Tuple[Any, ...]:
+    return (user_id, _response_generations.get(user_id, 0), endpoint, frozenset(request.query_params.items()))
+
+def invalidate_user_responses(user_id: str) -> None:
+    _response_generations[user_id] = _response_generations.get(user_id, 0) + 1
+
 # ============== AUTH ROUTES ==============
 
 @api_router.post("/auth/register", response_model=TokenResponse)
@@ -412,11 +830,13 @@ async def register(user_data: UserCreate):
     user_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
     
+    # bcrypt is CPU-bound; run it off the event loop so other requests keep flowing.
+    hashed_password = await asyncio.to_thread(hash_password, user_data.password)
     user_doc = {
         "id": user_id,
         "email": user_data.email,
         "name": user_data.name,
-        "password": hash_password(user_data.password),
+        "password": hashed_password,
         "created_at": now
     }
     
@@ -438,7 +858,7 @@ async def register(user_data: UserCreate):
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(login_data: UserLogin):
     user = await db.users.find_one({"email": login_data.email})
-    if not user or not verify_password(login_data.password, user["password"]):
+    if not user or not await asyncio.to_thread(verify_password, login_data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     token = create_access_token(user["id"], user["email"])
@@ -480,27 +900,31 @@ async def create_habit(habit_data: HabitCreate, current_user: dict = Depends(get
         "is_active": True,
         "created_at": now,
         "current_streak": 0,
-        "longest_streak": 0
+        "longest_streak": 0,
+        "last_completed_date": None
     }
     
     await db.habits.insert_one(habit_doc)
+    invalidate_user_responses(current_user["id"])
     
     return HabitResponse(**{k: v for k, v in habit_doc.items() if k != "_id"})
 
 @api_router.get("/habits", response_model=List[HabitResponse])
-async def get_habits(current_user: dict = Depends(get_current_user)):
+async def get_habits(request: Request, current_user: dict = Depends(get_current_user)):
+    cache_key = _response_cache_key(current_user["id"], "habits", request)
+    cached = _RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
     habits = await db.habits.find(
         {"user_id": current_user["id"]},
         {"_id": 0}
     ).to_list(100)
     
-    # Calculate streaks for each habit
-    for habit in habits:
-        streak_data = await calculate_streak(habit["id"], current_user["id"])
-        habit["current_streak"] = streak_data["current_streak"]
-        habit["longest_streak"] = streak_data["longest_streak"]
-    
-    return habits
+    today = datetime.now(timezone.utc).date()
+    result = [await _habit_with_streaks(habit, today) for habit in habits]
+    _RESPONSE_CACHE[cache_key] = result
+    return result
 
 @api_router.get("/habits/{habit_id}", response_model=HabitResponse)
 async def get_habit(habit_id: str, current_user: dict = Depends(get_current_user)):
@@ -511,15 +935,11 @@ async def get_habit(habit_id: str, current_user: dict = Depends(get_current_user
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
     
-    streak_data = await calculate_streak(habit_id, current_user["id"])
-    habit["current_streak"] = streak_data["current_streak"]
-    habit["longest_streak"] = streak_data["longest_streak"]
-    
-    return habit
+    return await _habit_with_streaks(habit, datetime.now(timezone.utc).date())
 
 @api_router.put("/habits/{habit_id}", response_model=HabitResponse)
 async def update_habit(habit_id: str, habit_data: HabitUpdate, current_user: dict = Depends(get_current_user)):
-    update_data = {k: v for k, v in habit_data.model_dump().items() if v is not None}
+    update_data = habit_data.model_dump(exclude_unset=True, exclude_none=True)
     
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
@@ -531,13 +951,10 @@ async def update_habit(habit_id: str, habit_data: HabitUpdate, current_user: dic
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Habit not found")
+    invalidate_user_responses(current_user["id"])
     
     habit = await db.habits.find_one({"id": habit_id}, {"_id": 0})
-    streak_data = await calculate_streak(habit_id, current_user["id"])
-    habit["current_streak"] = streak_data["current_streak"]
-    habit["longest_streak"] = streak_data["longest_streak"]
-    
-    return habit
+    return await _habit_with_streaks(habit, datetime.now(timezone.utc).date())
 
 @api_router.delete("/habits/{habit_id}")
 async def delete_habit(habit_id: str, current_user: dict = Depends(get_current_user)):
@@ -547,7 +964,9 @@ async def delete_habit(habit_id: str, current_user: dict = Depends(get_current_u
         raise HTTPException(status_code=404, detail="Habit not found")
     
     # Delete associated logs
+    await _remove_habit_from_daily_rollup(habit_id, current_user["id"])
     await db.habit_logs.delete_many({"habit_id": habit_id})
+    invalidate_user_responses(current_user["id"])
     
     return {"message": "Habit deleted successfully"}
 
@@ -576,6 +995,7 @@ async def log_habit(log_data: HabitLogCreate, current_user: dict = Depends(get_c
             {"id": existing_log["id"]},
             {"$set": {"status": log_data.status}}
         )
+        await _bump_daily_rollup(current_user["id"], log_data.date, old_status, log_data.status)
 
         await _apply_weekly_score_from_habit_log(
             user_id=current_user["id"],
@@ -583,6 +1003,9 @@ async def log_habit(log_data: HabitLogCreate, current_user: dict = Depends(get_c
             old_status=old_status,
             new_status=log_data.status,
         )
+        if "completed" in (old_status, log_data.status):
+            await _refresh_habit_streaks(log_data.habit_id, current_user["id"])
+        invalidate_user_responses(current_user["id"])
         return HabitLogResponse(
             id=existing_log["id"],
             habit_id=log_data.habit_id,
@@ -602,6 +1025,7 @@ async def log_habit(log_data: HabitLogCreate, current_user: dict = Depends(get_c
     }
     
     await db.habit_logs.insert_one(log_doc)
+    await _bump_daily_rollup(current_user["id"], log_data.date, None, log_data.status)
 
     await _apply_weekly_score_from_habit_log(
         user_id=current_user["id"],
@@ -609,6 +1033,9 @@ async def log_habit(log_data: HabitLogCreate, current_user: dict = Depends(get_c
         old_status=None,
         new_status=log_data.status,
     )
+    if log_data.status == "completed":
+        await _refresh_habit_streaks(log_data.habit_id, current_user["id"])
+    invalidate_user_responses(current_user["id"])
     
     return HabitLogResponse(**{k: v for k, v in log_doc.items() if k != "_id"})
 
@@ -649,103 +1076,253 @@ async def get_all_logs(
     logs = await db.habit_logs.find(query, {"_id": 0}).to_list(1000)
     return logs
 
+# ============== DAILY ROLLUP ==============
+# MongoDB only: user_habit_daily holds one {user_id, date, status, n} row per user, day and
+# status, kept in step with habit_logs on every write and rebuilt nightly from the logs.
+# Reads wait for the first full rebuild (meta "daily_rollup".ready); until then the rollup may
+# be missing logs written before it existed.
+
+_daily_rollup_ready = False
+
+async def _is_daily_rollup_ready() -> bool:
+    global _daily_rollup_ready
+    if not _daily_rollup_ready:
+        state = await db.meta.find_one({"id": "daily_rollup"}, {"_id": 0, "ready": 1})
+        _daily_rollup_ready = bool(state and state.get("ready"))
+    return _daily_rollup_ready
+
+async def _bump_daily_rollup(user_id: str, log_date: str, old_status: Optional[str], new_status: str) -> None:
+    if client is None or old_status == new_status:
+        return
+    now = datetime.now(timezone.utc)
+    ops = [
+        UpdateOne(
+            {"user_id": user_id, "date": log_date, "status": new_status},
+            {"$inc": {"n": 1}, "$set": {"updated_at": now}},
+            upsert=True,
+        )
+    ]
+    if old_status:
+        ops.append(
+            UpdateOne(
+                {"user_id": user_id, "date": log_date, "status": old_status},
+                {"$inc": {"n": -1}, "$set": {"updated_at": now}},
+            )
+        )
+    await db.user_habit_daily.bulk_write(ops, ordered=False)
+
+async def _remove_habit_from_daily_rollup(habit_id: str, user_id: str) -> None:
+    if client is None:
+        return
+    groups = await db.habit_logs.aggregate([
+        {"$match": {"habit_id": habit_id, "user_id": user_id}},
+        {"$group": {"_id": {"date": "$date", "status": "$status"}, "n": {"$sum": 1}}},
+    ]).to_list(None)
+    now = datetime.now(timezone.utc)
+    ops = [
+        UpdateOne(
+            {"user_id": user_id, "date": g["_id"]["date"], "status": g["_id"]["status"]},
+            {"$inc": {"n": -g["n"]}, "$set": {"updated_at": now}},
+        )
+        for g in groups
+    ]
+    if ops:
+        await db.user_habit_daily.bulk_write(ops, ordered=False)
+
+async def _rebuild_daily_rollup() -> None:
+    global _daily_rollup_ready
+    # Recount every row from habit_logs server-side; also backfills logs written before the rollup existed.
+    # Merged rows are stamped with this run's id. A row a live write touched after the run started
+    # keeps its value, since the recount may have read the logs before that write and would undo
+    # its $inc. Rows the recount did not reach have no logs left, so they are zeroed, again
+    # unless touched mid-run. The next rebuild settles any row skipped this way.
+    run_id = str(uuid.uuid4())
+    started_at = datetime.now(timezone.utc)
+    await db.habit_logs.aggregate([
+        {"$group": {"_id": {"user_id": "$user_id", "date": "$date", "status": "$status"}, "n": {"$sum": 1}}},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "date": "$_id.date",
+            "status": "$_id.status",
+            "n": 1,
+            "rebuilt": {"$literal": run_id},
+        }},
+        {"$merge": {
+            "into": "user_habit_daily",
+            "on": ["user_id", "date", "status"],
+            "whenMatched": [
+                {"$replaceWith": {"$cond": [
+                    {"$gte": ["$updated_at", started_at]},
+                    "$$ROOT",
+                    {"$mergeObjects": ["$$ROOT", "$$new"]},
+                ]}},
+            ],
+            "whenNotMatched": "insert",
+        }},
+    ]).to_list(None)
+    await db.user_habit_daily.update_many(
+        {
+            "rebuilt": {"$ne": run_id},
+            "n": {"$ne": 0},
+            "$or": [{"updated_at": {"$lt": started_at}}, {"updated_at": {"$exists": False}}],
+        },
+        {"$set": {"n": 0}},
+    )
+    await db.meta.update_one(
+        {"id": "daily_rollup"},
+        {"$set": {"ready": True, "rebuilt_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True,
+    )
+    _daily_rollup_ready = True
+    logger.info("Rebuilt user_habit_daily rollup from habit_logs")
+
 # ============== ANALYTICS ROUTES ==============
 
-async def calculate_streak(habit_id: str, user_id: str) -> dict:
+async def _completed_dates(habit_id: str, user_id: str) -> List[str]:
     logs = await db.habit_logs.find(
         {"habit_id": habit_id, "user_id": user_id, "status": "completed"},
         {"_id": 0}
     ).sort("date", -1).to_list(1000)
-    
-    if not logs:
+    return [log["date"] for log in logs]
+
+async def calculate_streak(habit_id: str, user_id: str, logs: Optional[List[Dict[str, Any]]] = None) -> dict:
+    # Pass `logs` (already loaded for the request) to filter in memory instead of querying again.
+    if logs is None:
+        dates = await _completed_dates(habit_id, user_id)
+    else:
+        dates = [log["date"] for log in logs if log["habit_id"] == habit_id and log["status"] == "completed"]
+    return _compute_streaks(dates, datetime.now(timezone.utc).date())
+
+def _compute_streaks(dates: List[str], today: date) -> dict:
+    if not dates:
         return {"current_streak": 0, "longest_streak": 0}
     
-    dates = sorted([log["date"] for log in logs], reverse=True)
+    # Single pass over distinct day ordinals, newest first. The first run is the current
+    # streak when it reaches today or yesterday; every run counts towards the longest.
+    days = sorted({date.fromisoformat(date_str).toordinal() for date_str in dates}, reverse=True)
+    anchored = today.toordinal() - days[0] <= 1
     
-    # Calculate current streak
     current_streak = 0
-    today = datetime.now(timezone.utc).date()
-    check_date = today
-    
-    for i in range(len(dates)):
-        date_str = dates[i]
-        log_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-        
-        if i == 0:
-            # First date should be today or yesterday
-            diff = (today - log_date).days
-            if diff > 1:
-                break
-            check_date = log_date
-            current_streak = 1
-        else:
-            expected_date = check_date - timedelta(days=1)
-            if log_date == expected_date:
-                current_streak += 1
-                check_date = log_date
-            else:
-                break
-    
-    # Calculate longest streak
     longest_streak = 0
-    streak = 0
-    prev_date = None
+    run = 0
+    in_first_run = True
+    prev_day = None
     
-    for date_str in sorted(dates):
-        log_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-        
-        if prev_date is None:
-            streak = 1
-        elif (log_date - prev_date).days == 1:
-            streak += 1
+    for day in days:
+        if prev_day is None or prev_day - day == 1:
+            run += 1
         else:
-            longest_streak = max(longest_streak, streak)
-            streak = 1
-        
-        prev_date = log_date
-    
-    longest_streak = max(longest_streak, streak, current_streak)
+            in_first_run = False
+            run = 1
+        if in_first_run and anchored:
+            current_streak = run
+        longest_streak = max(longest_streak, run)
+        prev_day = day
     
     return {"current_streak": current_streak, "longest_streak": longest_streak}
 
+async def _refresh_habit_streaks(habit_id: str, user_id: str) -> Dict[str, Any]:
+    # Streaks are stored on the habit doc so reads don't rescan habit_logs.
+    # current_streak is the run ending at last_completed_date; readers zero it once that run lapses.
+    dates = await _completed_dates(habit_id, user_id)
+    if dates:
+        last_completed = max(dates)
+        streak_data = _compute_streaks(dates, date.fromisoformat(last_completed))
+        fields = {**streak_data, "last_completed_date": last_completed}
+    else:
+        fields = {"current_streak": 0, "longest_streak": 0, "last_completed_date": None}
+    await db.habits.update_one({"id": habit_id}, {"$set": fields})
+    return fields
+
+def _live_streaks(habit: Dict[str, Any], today: date) -> Dict[str, Any]:
+    last_completed = habit.get("last_completed_date")
+    if last_completed and (today - date.fromisoformat(last_completed)).days <= 1:
+        return habit
+    return {**habit, "current_streak": 0}
+
+async def _habit_with_streaks(habit: Dict[str, Any], today: date) -> Dict[str, Any]:
+    if "last_completed_date" not in habit:
+        # Habits created before streaks were stored: backfill once.
+        habit = {**habit, **await _refresh_habit_streaks(habit["id"], habit["user_id"])}
+    return _live_streaks(habit, today)
+
+@lru_cache(maxsize=32)
+def _iso_days(start: date, count: int) -> Tuple[Tuple[date, str], ...]:
+    # (date, "YYYY-MM-DD") for `count` consecutive days; the same windows recur across requests all day.
+    return tuple((day, day.isoformat()) for day in (start + timedelta(days=i) for i in range(count)))
+
+# Analytics only read these log fields; the (user_id, date, status, habit_id) index covers them,
+# so Mongo answers these queries from the index without fetching the documents.
+_ANALYTICS_LOG_FIELDS = {"_id": 0, "habit_id": 1, "date": 1, "status": 1}
+
+def _tally_logs(logs: List[Dict[str, Any]]) -> Tuple[Counter, Counter]:
+    # Single pass over the logs: totals per status and completions per date.
+    status_counts: Counter = Counter()
+    completed_by_date: Counter = Counter()
+    for log in logs:
+        status = log["status"]
+        status_counts[status] += 1
+        if status == "completed":
+            completed_by_date[log["date"]] += 1
+    return status_counts, completed_by_date
+
+# Log data behind the analytics views, shared across endpoints for a short while (the frontend
+# loads monthly and yearly back to back). Keys carry the user's response generation, so any
+# habit/log write (invalidate_user_responses) retires them.
+_ANALYTICS_DATA_CACHE = _TTLCache(maxsize=1024, ttl=30)
+
+def _analytics_data_key(user_id: str, year: Optional[int] = None, month: Optional[int] = None) -> Tuple[Any, ...]:
+    return (user_id, _response_generations.get(user_id, 0), year, month)
+
+async def get_user_logs(user_id: str) -> List[Dict[str, Any]]:
+    # All of the user's logs; analytics filter this list in memory.
+    cache_key = _analytics_data_key(user_id)
+    logs = _ANALYTICS_DATA_CACHE.get(cache_key)
+    if logs is None:
+        logs = await db.habit_logs.find({"user_id": user_id}, _ANALYTICS_LOG_FIELDS).to_list(100000)
+        _ANALYTICS_DATA_CACHE[cache_key] = logs
+    return logs
+
 @api_router.get("/analytics/dashboard")
-async def get_dashboard_analytics(current_user: dict = Depends(get_current_user)):
+async def get_dashboard_analytics(request: Request, current_user: dict = Depends(get_current_user)):
+    cache_key = _response_cache_key(current_user["id"], "analytics/dashboard", request)
+    cached = _RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
     user_id = current_user["id"]
     today = datetime.now(timezone.utc).date()
+    all_logs = await get_user_logs(user_id)
     
     # Get all habits
     habits = await db.habits.find({"user_id": user_id, "is_active": True}, {"_id": 0}).to_list(100)
     total_habits = len(habits)
     
     # Calculate overall current streak (best streak among all habits)
-    max_current_streak = 0
-    for habit in habits:
-        streak_data = await calculate_streak(habit["id"], user_id)
-        max_current_streak = max(max_current_streak, streak_data["current_streak"])
+    habits = [await _habit_with_streaks(habit, today) for habit in habits]
+    max_current_streak = max((habit["current_streak"] for habit in habits), default=0)
     
     # Get weekly data (last 7 days)
-    week_start = (today - timedelta(days=6)).isoformat()
-    week_end = today.isoformat()
+    week_days = _iso_days(today - timedelta(days=6), 7)
+    week_start = week_days[0][1]
+    week_end = week_days[-1][1]
     
-    week_logs = await db.habit_logs.find({
-        "user_id": user_id,
-        "date": {"$gte": week_start, "$lte": week_end}
-    }, {"_id": 0}).to_list(1000)
+    week_logs = [log for log in all_logs if week_start <= log["date"] <= week_end]
+    
+    week_status_counts, completed_by_date = _tally_logs(week_logs)
     
     # Calculate weekly completion percentage
     total_possible = total_habits * 7 if total_habits > 0 else 1
-    completed_this_week = sum(1 for log in week_logs if log["status"] == "completed")
+    completed_this_week = week_status_counts["completed"]
     weekly_completion = round((completed_this_week / total_possible) * 100, 1) if total_possible > 0 else 0
     
     # Daily completion data for bar chart (Mon-Sun)
     daily_data = []
     day_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
     
-    for i in range(7):
-        day = today - timedelta(days=6-i)
-        day_str = day.isoformat()
-        day_logs = [log for log in week_logs if log["date"] == day_str]
-        completed = sum(1 for log in day_logs if log["status"] == "completed")
+    for day, day_str in week_days:
+        completed = completed_by_date[day_str]
         daily_data.append({
             "day": day_names[day.weekday()],
             "date": day_str,
@@ -756,11 +1333,8 @@ async def get_dashboard_analytics(current_user: dict = Depends(get_current_user)
     
     # Weekly performance data for line chart
     weekly_performance = []
-    for i in range(7):
-        day = today - timedelta(days=6-i)
-        day_str = day.isoformat()
-        day_logs = [log for log in week_logs if log["date"] == day_str]
-        completed = sum(1 for log in day_logs if log["status"] == "completed")
+    for day, day_str in week_days:
+        completed = completed_by_date[day_str]
         percentage = round((completed / total_habits) * 100) if total_habits > 0 else 0
         weekly_performance.append({
             "day": day_names[day.weekday()],
@@ -769,15 +1343,15 @@ async def get_dashboard_analytics(current_user: dict = Depends(get_current_user)
         })
     
     # Overall completion rate for donut chart
-    all_logs = await db.habit_logs.find({"user_id": user_id}, {"_id": 0}).to_list(10000)
     total_logs = len(all_logs)
-    completed_logs = sum(1 for log in all_logs if log["status"] == "completed")
-    missed_logs = sum(1 for log in all_logs if log["status"] == "missed")
-    skipped_logs = sum(1 for log in all_logs if log["status"] == "skipped")
+    status_counts, _ = _tally_logs(all_logs)
+    completed_logs = status_counts["completed"]
+    missed_logs = status_counts["missed"]
+    skipped_logs = status_counts["skipped"]
     
     overall_completion = round((completed_logs / total_logs) * 100, 1) if total_logs > 0 else 0
     
-    return {
+    result = {
         "kpis": {
             "current_streak": max_current_streak,
             "total_habits": total_habits,
@@ -792,20 +1366,29 @@ async def get_dashboard_analytics(current_user: dict = Depends(get_current_user)
             "skipped": skipped_logs
         }
     }
+    _RESPONSE_CACHE[cache_key] = result
+    return result
 
 @api_router.get("/analytics/weekly")
-async def get_weekly_analytics(current_user: dict = Depends(get_current_user)):
+async def get_weekly_analytics(request: Request, current_user: dict = Depends(get_current_user)):
+    cache_key = _response_cache_key(current_user["id"], "analytics/weekly", request)
+    cached = _RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
     user_id = current_user["id"]
     today = datetime.now(timezone.utc).date()
     week_start = today - timedelta(days=today.weekday())
-    week_end = week_start + timedelta(days=6)
+    week_days = _iso_days(week_start, 7)
     
     habits = await db.habits.find({"user_id": user_id, "is_active": True}, {"_id": 0}).to_list(100)
     
     logs = await db.habit_logs.find({
         "user_id": user_id,
-        "date": {"$gte": week_start.isoformat(), "$lte": week_end.isoformat()}
-    }, {"_id": 0}).to_list(1000)
+        "date": {"$gte": week_days[0][1], "$lte": week_days[-1][1]}
+    }, _ANALYTICS_LOG_FIELDS).to_list(1000)
+    
+    status_counts, completed_by_date = _tally_logs(logs)
     
     # Daily scores
     day_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
@@ -813,13 +1396,10 @@ async def get_weekly_analytics(current_user: dict = Depends(get_current_user)):
     best_day = {"day": "", "score": 0}
     worst_day = {"day": "", "score": 100}
     
-    for i in range(7):
-        day = week_start + timedelta(days=i)
+    for i, (day, day_str) in enumerate(week_days):
         if day > today:
             break
-        day_str = day.isoformat()
-        day_logs = [log for log in logs if log["date"] == day_str]
-        completed = sum(1 for log in day_logs if log["status"] == "completed")
+        completed = completed_by_date[day_str]
         score = round((completed / len(habits)) * 100) if habits else 0
         
         daily_scores.append({
@@ -836,25 +1416,33 @@ async def get_weekly_analytics(current_user: dict = Depends(get_current_user)):
             worst_day = {"day": day_names[i], "score": score}
     
     # Weekly score
-    total_completed = sum(1 for log in logs if log["status"] == "completed")
+    total_completed = status_counts["completed"]
     possible = len(habits) * min(7, (today - week_start).days + 1)
     weekly_score = round((total_completed / possible) * 100) if possible > 0 else 0
     
-    return {
+    result = {
         "daily_scores": daily_scores,
         "weekly_score": weekly_score,
         "best_day": best_day,
         "worst_day": worst_day,
         "total_completed": total_completed,
-        "total_missed": sum(1 for log in logs if log["status"] == "missed")
+        "total_missed": status_counts["missed"]
     }
+    _RESPONSE_CACHE[cache_key] = result
+    return result
 
 @api_router.get("/analytics/monthly")
 async def get_monthly_analytics(
+    request: Request,
     year: Optional[int] = None,
     month: Optional[int] = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
 ):
+    cache_key = _response_cache_key(current_user["id"], "analytics/monthly", request)
+    cached = _RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
     user_id = current_user["id"]
     today = datetime.now(timezone.utc).date()
     
@@ -871,21 +1459,24 @@ async def get_monthly_analytics(
         last_day = datetime(year, month + 1, 1).date() - timedelta(days=1)
     
     habits = await db.habits.find({"user_id": user_id}, {"_id": 0}).to_list(100)
+    all_logs = await get_user_logs(user_id)
     
-    logs = await db.habit_logs.find({
-        "user_id": user_id,
-        "date": {"$gte": first_day.isoformat(), "$lte": last_day.isoformat()}
-    }, {"_id": 0}).to_list(10000)
+    month_start, month_end = first_day.isoformat(), last_day.isoformat()
+    logs = [log for log in all_logs if month_start <= log["date"] <= month_end]
+    logs_by_habit: Dict[str, List[Dict[str, Any]]] = {}
+    for log in all_logs:
+        logs_by_habit.setdefault(log["habit_id"], []).append(log)
+    by_habit_status = Counter((log["habit_id"], log["status"]) for log in logs)
+    
+    days_in_month = (last_day - first_day).days + 1
+    actual_days = min(days_in_month, (today - first_day).days + 1) if today.month == month and today.year == year else days_in_month
     
     # Habit-wise completion
     habit_stats = []
     for habit in habits:
-        habit_logs = [log for log in logs if log["habit_id"] == habit["id"]]
-        completed = sum(1 for log in habit_logs if log["status"] == "completed")
-        days_in_month = (last_day - first_day).days + 1
-        actual_days = min(days_in_month, (today - first_day).days + 1) if today.month == month and today.year == year else days_in_month
+        completed = by_habit_status[(habit["id"], "completed")]
         
-        streak_data = await calculate_streak(habit["id"], user_id)
+        streak_data = await calculate_streak(habit["id"], user_id, logs_by_habit.get(habit["id"], []))
         
         habit_stats.append({
             "id": habit["id"],
@@ -899,22 +1490,118 @@ async def get_monthly_analytics(
         })
     
     # Missed days count
-    missed_count = sum(1 for log in logs if log["status"] == "missed")
+    status_counts, _ = _tally_logs(logs)
+    missed_count = status_counts["missed"]
     
-    return {
+    result = {
         "year": year,
         "month": month,
         "habit_stats": habit_stats,
-        "total_completed": sum(1 for log in logs if log["status"] == "completed"),
+        "total_completed": status_counts["completed"],
         "missed_days_count": missed_count,
         "overall_completion": round((sum(h["completion_percentage"] for h in habit_stats) / len(habit_stats))) if habit_stats else 0
     }
+    _RESPONSE_CACHE[cache_key] = result
+    return result
+
+async def _fetch_year_logs(user_id: str, year: int) -> Tuple[Counter, Counter, Optional[Tuple[str, int]]]:
+    # (status totals, completions per date, (top habit id, completions) or None) for the year.
+    cache_key = _analytics_data_key(user_id, year)
+    cached = _ANALYTICS_DATA_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    year_start = f"{year}-01-01"
+    year_end = f"{year}-12-31"
+    
+    if client is not None:
+        result = await _aggregate_year_logs(user_id, year_start, year_end)
+    else:
+        logs = await db.habit_logs.find({
+            "user_id": user_id,
+            "date": {"$gte": year_start, "$lte": year_end}
+        }, _ANALYTICS_LOG_FIELDS).to_list(50000)
+        status_counts, completed_by_date = _tally_logs(logs)
+        
+        # Running argmax while counting; ties go to the smaller habit id, as in the Mongo pipeline.
+        habit_completions: Dict[str, int] = {}
+        top_entry = None
+        for log in logs:
+            if log["status"] == "completed":
+                habit_id = log["habit_id"]
+                n = habit_completions.get(habit_id, 0) + 1
+                habit_completions[habit_id] = n
+                if top_entry is None or n > top_entry[1] or (n == top_entry[1] and habit_id < top_entry[0]):
+                    top_entry = (habit_id, n)
+        result = (status_counts, completed_by_date, top_entry)
+    
+    _ANALYTICS_DATA_CACHE[cache_key] = result
+    return result
+
+async def _aggregate_year_logs(
+    user_id: str, year_start: str, year_end: str
+) -> Tuple[Counter, Counter, Optional[Tuple[str, int]]]:
+    # Per-day and per-status totals come from the user_habit_daily rollup (a few rows per
+    # day); only the top habit still needs grouping over the year's completed logs.
+    date_range = {"$gte": year_start, "$lte": year_end}
+    if not await _is_daily_rollup_ready():
+        # Before the rollup's first backfill, group the year's logs server-side in one $facet.
+        rows = await db.habit_logs.aggregate([
+            {"$match": {"user_id": user_id, "date": date_range}},
+            {"$facet": {
+                "totals": [
+                    {"$group": {"_id": "$status", "n": {"$sum": 1}}},
+                ],
+                "daily": [
+                    {"$match": {"status": "completed"}},
+                    {"$group": {"_id": "$date", "n": {"$sum": 1}}},
+                ],
+                "top_habit": [
+                    {"$match": {"status": "completed"}},
+                    {"$group": {"_id": "$habit_id", "n": {"$sum": 1}}},
+                    {"$sort": {"n": -1, "_id": 1}},
+                    {"$limit": 1},
+                ],
+            }},
+        ]).to_list(1)
+        facets = rows[0] if rows else {}
+        status_counts = Counter({row["_id"]: row["n"] for row in facets.get("totals", [])})
+        completed_by_date = Counter({row["_id"]: row["n"] for row in facets.get("daily", [])})
+        top = facets.get("top_habit") or []
+        top_entry = (top[0]["_id"], top[0]["n"]) if top else None
+        return status_counts, completed_by_date, top_entry
+
+    daily_rows = await db.user_habit_daily.find(
+        {"user_id": user_id, "date": date_range, "n": {"$gt": 0}},
+        {"_id": 0, "date": 1, "status": 1, "n": 1},
+    ).to_list(None)
+    status_counts: Counter = Counter()
+    completed_by_date: Counter = Counter()
+    for row in daily_rows:
+        status_counts[row["status"]] += row["n"]
+        if row["status"] == "completed":
+            completed_by_date[row["date"]] += row["n"]
+
+    top = await db.habit_logs.aggregate([
+        {"$match": {"user_id": user_id, "date": date_range, "status": "completed"}},
+        {"$group": {"_id": "$habit_id", "n": {"$sum": 1}}},
+        {"$sort": {"n": -1, "_id": 1}},
+        {"$limit": 1},
+    ]).to_list(1)
+    top_entry = (top[0]["_id"], top[0]["n"]) if top else None
+    return status_counts, completed_by_date, top_entry
 
 @api_router.get("/analytics/yearly")
 async def get_yearly_analytics(
+    request: Request,
     year: Optional[int] = None,
     current_user: dict = Depends(get_current_user)
 ):
+    cache_key = _response_cache_key(current_user["id"], "analytics/yearly", request)
+    cached = _RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
     user_id = current_user["id"]
     today = datetime.now(timezone.utc).date()
     
@@ -923,14 +1610,11 @@ async def get_yearly_analytics(
     
     habits = await db.habits.find({"user_id": user_id}, {"_id": 0}).to_list(100)
     
-    # Get all logs for the year
-    year_start = f"{year}-01-01"
-    year_end = f"{year}-12-31"
+    status_counts, completed_by_date, top_entry = await _fetch_year_logs(user_id, year)
     
-    logs = await db.habit_logs.find({
-        "user_id": user_id,
-        "date": {"$gte": year_start, "$lte": year_end}
-    }, {"_id": 0}).to_list(50000)
+    completed_by_month: Counter = Counter()
+    for day_str, count in completed_by_date.items():
+        completed_by_month[int(day_str[5:7])] += count
     
     # Month-wise completion
     monthly_data = []
@@ -939,20 +1623,9 @@ async def get_yearly_analytics(
     best_month = {"month": "", "percentage": 0}
     
     for m in range(1, 13):
-        month_start = f"{year}-{m:02d}-01"
-        if m == 12:
-            month_end = f"{year}-12-31"
-        else:
-            month_end = f"{year}-{m+1:02d}-01"
+        completed = completed_by_month[m]
         
-        month_logs = [log for log in logs if month_start <= log["date"] < month_end]
-        completed = sum(1 for log in month_logs if log["status"] == "completed")
-        
-        # Calculate days in month
-        if m == 12:
-            days = 31
-        else:
-            days = (datetime(year, m + 1, 1) - datetime(year, m, 1)).days
+        days = calendar.monthrange(year, m)[1]
         
         possible = len(habits) * days if habits else 1
         percentage = round((completed / possible) * 100) if possible > 0 else 0
@@ -969,46 +1642,36 @@ async def get_yearly_analytics(
     
     # Heatmap data (daily completion count)
     heatmap_data = []
-    current = datetime(year, 1, 1).date()
-    end = min(datetime(year, 12, 31).date(), today)
-    
-    while current <= end:
-        day_str = current.isoformat()
-        day_logs = [log for log in logs if log["date"] == day_str]
-        completed = sum(1 for log in day_logs if log["status"] == "completed")
-        total = len(habits)
-        
+    first_day = date(year, 1, 1)
+    end = min(date(year, 12, 31), today)
+    total = len(habits)
+    
+    for _, day_str in _iso_days(first_day, max(0, (end - first_day).days + 1)):
+        completed = completed_by_date.get(day_str, 0)
         heatmap_data.append({
             "date": day_str,
             "value": completed,
             "total": total,
             "level": min(4, int((completed / total) * 4)) if total > 0 else 0
         })
-        current += timedelta(days=1)
     
     # Top habit of the year
-    habit_completions = {}
-    for log in logs:
-        if log["status"] == "completed":
-            habit_id = log["habit_id"]
-            habit_completions[habit_id] = habit_completions.get(habit_id, 0) + 1
-    
     top_habit = None
-    if habit_completions:
-        top_habit_id = max(habit_completions, key=habit_completions.get)
+    if top_entry:
+        top_habit_id, top_completions = top_entry
         top_habit_data = next((h for h in habits if h["id"] == top_habit_id), None)
         if top_habit_data:
             top_habit = {
                 "name": top_habit_data["name"],
-                "completions": habit_completions[top_habit_id]
+                "completions": top_completions
             }
     
     # Overall productivity score
-    total_completed = sum(1 for log in logs if log["status"] == "completed")
-    total_logged = len(logs)
+    total_completed = status_counts["completed"]
+    total_logged = sum(status_counts.values())
     productivity_score = round((total_completed / total_logged) * 100) if total_logged > 0 else 0
     
-    return {
+    result = {
         "year": year,
         "monthly_data": monthly_data,
         "heatmap_data": heatmap_data,
@@ -1016,51 +1679,60 @@ async def get_yearly_analytics(
         "best_month": best_month,
         "productivity_score": productivity_score,
         "total_completed": total_completed,
-        "total_missed": sum(1 for log in logs if log["status"] == "missed")
+        "total_missed": status_counts["missed"]
     }
+    _RESPONSE_CACHE[cache_key] = result
+    return result
 
 
 # ============== LEADERBOARD HELPERS ==============
 
 LEADERBOARD_TZ = os.environ.get("LEADERBOARD_TZ", "UTC")
 
+# Leaderboard state only changes at the weekly reset, so _ensure_current_week keeps the
+# last read in process until the current week ends.
+_week_state: Optional[Dict[str, Any]] = None
+_week_state_until: Optional[datetime] = None
+
 
+@lru_cache(maxsize=1)
 def _get_leaderboard_tz() -> ZoneInfo:
+    # LEADERBOARD_TZ is read once at import, so the zone only needs to be loaded once.
     try:
         return ZoneInfo(LEADERBOARD_TZ or "UTC")
     except Exception:
         return ZoneInfo("UTC")
 
 
-def _now_lb() -> datetime:
-    return datetime.now(_get_leaderboard_tz())
+def _now_lb(tz: Optional[ZoneInfo] = None) -> datetime:
+    return datetime.now(tz or _get_leaderboard_tz())
+
 
+# The helpers below take the leaderboard tz from the caller, which looks it up once per request.
 
-def _week_bounds(dt: datetime) -> tuple[datetime, datetime]:
+def _week_bounds(dt: datetime, tz: ZoneInfo) -> tuple[datetime, datetime]:
     # Week: Monday 00:00 -> Sunday 23:59 (inclusive) in leaderboard timezone.
-    tz = _get_leaderboard_tz()
-    dt = dt.astimezone(tz)
-    week_start = (dt - timedelta(days=dt.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
-    week_end_date = (week_start + timedelta(days=6)).date()
+    return _week_bounds_for_day(dt.astimezone(tz).date(), tz)
+
+
+@lru_cache(maxsize=64)
+def _week_bounds_for_day(day: date, tz: ZoneInfo) -> tuple[datetime, datetime]:
+    week_start_date = day - timedelta(days=day.weekday())
+    week_start = datetime(week_start_date.year, week_start_date.month, week_start_date.day, tzinfo=tz)
+    week_end_date = week_start_date + timedelta(days=6)
     week_end = datetime(week_end_date.year, week_end_date.month, week_end_date.day, 23, 59, 0, tzinfo=tz)
     return week_start, week_end
 
 
-def _day_end(dt: datetime) -> datetime:
-    dt = dt.astimezone(_get_leaderboard_tz())
+def _day_end(dt: datetime, tz: ZoneInfo) -> datetime:
+    dt = dt.astimezone(tz)
     return dt.replace(hour=23, minute=59, second=0, microsecond=0)
 
 
-def _month_end(dt: datetime) -> datetime:
-    tz = _get_leaderboard_tz()
-    dt = dt.astimezone(tz)
-    year, month = dt.year, dt.month
-    if month == 12:
-        next_month = datetime(year + 1, 1, 1, tzinfo=tz)
-    else:
-        next_month = datetime(year, month + 1, 1, tzinfo=tz)
-    last_day = (next_month - timedelta(days=1)).date()
-    return datetime(last_day.year, last_day.month, last_day.day, 23, 59, 0, tzinfo=tz)
+def _month_end(dt: datetime, tz: ZoneInfo) -> datetime:
+    day = dt.astimezone(tz).date()
+    last_day = calendar.monthrange(day.year, day.month)[1]
+    return datetime(day.year, day.month, last_day, 23, 59, 0, tzinfo=tz)
 
 
 def _points_for_status(status_value: Optional[str]) -> int:
@@ -1078,8 +1750,8 @@ async def _get_or_init_leaderboard_state() -> Dict[str, Any]:
     if state:
         return state
 
-    now = _now_lb()
-    week_start, week_end = _week_bounds(now)
+    tz = _get_leaderboard_tz()
+    week_start, week_end = _week_bounds(_now_lb(tz), tz)
     now_utc = datetime.now(timezone.utc).isoformat()
 
     state = {
@@ -1101,27 +1773,42 @@ async def _set_leaderboard_state(update: Dict[str, Any]) -> Dict[str, Any]:
     return state or update
 
 
+def _parse_week_state(state: Dict[str, Any]) -> tuple[datetime, datetime]:
+    tz = _get_leaderboard_tz()
+    try:
+        return (
+            datetime.fromisoformat(state["week_start"]).astimezone(tz),
+            datetime.fromisoformat(state["week_end"]).astimezone(tz),
+        )
+    except Exception:
+        return _week_bounds(_now_lb(tz), tz)
+
+
 async def _ensure_current_week() -> Dict[str, Any]:
+    # The returned state also carries the parsed bounds as "week_start_dt" / "week_end_dt".
+    global _week_state, _week_state_until
+    state = _week_state
+    if state is not None and _week_state_until is not None and _now_lb() < _week_state_until:
+        return state
+
     # Fallback if scheduler missed: rollover when needed on request.
     async with leaderboard_lock:
         state = await _get_or_init_leaderboard_state()
-        now = _now_lb()
+        week_start, week_end = _parse_week_state(state)
 
-        try:
-            state_week_start = datetime.fromisoformat(state["week_start"]).astimezone(_get_leaderboard_tz())
-            state_week_end = datetime.fromisoformat(state["week_end"]).astimezone(_get_leaderboard_tz())
-        except Exception:
-            state_week_start, state_week_end = _week_bounds(now)
-
-        if now >= state_week_end:
-            await _run_weekly_reset_locked(state_week_start, state_week_end)
+        if _now_lb() >= week_end:
+            await _run_weekly_reset_locked(week_start, week_end)
             state = await _get_or_init_leaderboard_state()
+            week_start, week_end = _parse_week_state(state)
 
+        state = {**state, "week_start_dt": week_start, "week_end_dt": week_end}
+        _week_state, _week_state_until = state, week_end
         return state
 
 
 async def _run_weekly_reset_locked(week_start: datetime, week_end: datetime) -> None:
     # Assumes leaderboard_lock is held.
+    global _week_state, _week_state_until
     state = await _get_or_init_leaderboard_state()
     if state.get("last_archived_week_end") == week_end.isoformat():
         logger.info("Leaderboard reset already completed for %s", week_end.isoformat())
@@ -1129,49 +1816,71 @@ async def _run_weekly_reset_locked(week_start: datetime, week_end: datetime) ->
 
     reset_at_utc = datetime.now(timezone.utc).isoformat()
 
-    users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(100000)
-    scores = await db.weekly_scores.find(
-        {"week_start": week_start.isoformat(), "week_end": week_end.isoformat()},
-        {"_id": 0},
-    ).to_list(100000)
+    users, scores = await asyncio.gather(
+        db.users.find({}, {"_id": 0, "password": 0}).to_list(100000),
+        db.weekly_scores.find(
+            {"week_start": week_start.isoformat(), "week_end": week_end.isoformat()},
+            {"_id": 0},
+        ).to_list(100000),
+    )
     score_by_user = {s.get("user_id"): int(s.get("score", 0)) for s in scores if s.get("user_id")}
 
     # Archive for all users (including zero-score users)
-    for u in users:
-        user_id = u.get("id")
-        if not user_id:
-            continue
-        history_doc = {
+    history_docs = [
+        {
             "id": str(uuid.uuid4()),
-            "user_id": user_id,
+            "user_id": u["id"],
             "name": u.get("name"),
             "avatar_url": u.get("avatar_url"),
-            "score": score_by_user.get(user_id, 0),
+            "score": score_by_user.get(u["id"], 0),
             "week_start": week_start.isoformat(),
             "week_end": week_end.isoformat(),
             "archived_at": reset_at_utc,
         }
-        await db.weekly_history.insert_one(history_doc)
-
-    await db.weekly_scores.delete_many({"week_start": week_start.isoformat(), "week_end": week_end.isoformat()})
+        for u in users
+        if u.get("id")
+    ]
 
     # Initialize next week (Monday 00:00 right after reset)
     next_anchor = (week_end + timedelta(minutes=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-    new_week_start, new_week_end = _week_bounds(next_anchor)
+    new_week_start, new_week_end = _week_bounds(next_anchor, _get_leaderboard_tz())
 
-    for u in users:
-        user_id = u.get("id")
-        if not user_id:
-            continue
-        weekly_doc = {
+    new_week_docs = [
+        {
             "id": str(uuid.uuid4()),
-            "user_id": user_id,
+            "user_id": u["id"],
             "score": 0,
             "week_start": new_week_start.isoformat(),
             "week_end": new_week_end.isoformat(),
             "updated_at": reset_at_utc,
         }
-        await db.weekly_scores.insert_one(weekly_doc)
+        for u in users
+        if u.get("id")
+    ]
+
+    # The archive and the new week's rows don't overlap, so both batches go out together.
+    writes = []
+    if history_docs:
+        writes.append(db.weekly_history.insert_many(history_docs, ordered=False))
+    if new_week_docs and client is not None:
+        # Upsert per user so a row already written for the new week (unique on user/week) is kept.
+        writes.append(db.weekly_scores.bulk_write(
+            [
+                UpdateOne(
+                    {"user_id": d["user_id"], "week_start": d["week_start"], "week_end": d["week_end"]},
+                    {"$setOnInsert": {"id": d["id"], "score": 0, "updated_at": reset_at_utc}},
+                    upsert=True,
+                )
+                for d in new_week_docs
+            ],
+            ordered=False,
+        ))
+    elif new_week_docs:
+        writes.append(db.weekly_scores.insert_many(new_week_docs, ordered=False))
+    await asyncio.gather(*writes)
+
+    # Only drop last week's scores once they are archived.
+    await db.weekly_scores.delete_many({"week_start": week_start.isoformat(), "week_end": week_end.isoformat()})
 
     await _set_leaderboard_state(
         {
@@ -1182,6 +1891,7 @@ async def _run_weekly_reset_locked(week_start: datetime, week_end: datetime) ->
             "updated_at": reset_at_utc,
         }
     )
+    _week_state = _week_state_until = None
 
     logger.info(
         "Weekly leaderboard reset complete. Archived %s..%s, new week %s..%s",
@@ -1192,6 +1902,53 @@ async def _run_weekly_reset_locked(week_start: datetime, week_end: datetime) ->
     )
 
 
+async def _increment_weekly_score(
+    user_id: str,
+    week_start: datetime,
+    week_end: datetime,
+    delta: int,
+    now_utc: str,
+) -> int:
+    # Adds delta to the user's score for the week (never below 0) and returns the new score.
+    week_filter = {"user_id": user_id, "week_start": week_start.isoformat(), "week_end": week_end.isoformat()}
+
+    if client is not None:
+        # Single atomic upsert; the pipeline form lets Mongo apply the 0 floor server-side.
+        doc = await db.weekly_scores.find_one_and_update(
+            week_filter,
+            [
+                {
+                    "$set": {
+                        "score": {"$max": [0, {"$add": [{"$ifNull": ["$score", 0]}, delta]}]},
+                        "id": {"$ifNull": ["$id", str(uuid.uuid4())]},
+                        "updated_at": now_utc,
+                    }
+                }
+            ],
+            projection={"_id": 0, "score": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return int(doc.get("score", 0))
+
+    # File-backed DB lives in this process, so a per-user lock is enough.
+    async with user_score_locks.for_user(user_id):
+        existing = await db.weekly_scores.find_one(week_filter, {"_id": 0})
+        if not existing:
+            new_score = max(0, delta)
+            await db.weekly_scores.insert_one(
+                {"id": str(uuid.uuid4()), **week_filter, "score": new_score, "updated_at": now_utc}
+            )
+            return new_score
+
+        new_score = max(0, int(existing.get("score", 0)) + delta)
+        await db.weekly_scores.update_one(
+            {"id": existing["id"]},
+            {"$set": {"score": new_score, "updated_at": now_utc}},
+        )
+        return new_score
+
+
 async def _apply_weekly_score_from_habit_log(
     *,
     user_id: str,
@@ -1199,75 +1956,121 @@ async def _apply_weekly_score_from_habit_log(
     old_status: Optional[str],
     new_status: str,
 ) -> None:
-    state = await _ensure_current_week()
+    # Pure-Python scoring first: status changes worth 0 points never touch the week state.
+    delta = _points_for_status(new_status) - _points_for_status(old_status)
+    delta += _streak_bonus_delta(old_status=old_status, new_status=new_status)
+    if delta == 0:
+        return
 
-    try:
-        week_start = datetime.fromisoformat(state["week_start"]).astimezone(_get_leaderboard_tz())
-        week_end = datetime.fromisoformat(state["week_end"]).astimezone(_get_leaderboard_tz())
-    except Exception:
-        now = _now_lb()
-        week_start, week_end = _week_bounds(now)
+    state = await _ensure_current_week()
+    week_start, week_end = state["week_start_dt"], state["week_end_dt"]
 
     week_start_date = week_start.date().isoformat()
     week_end_date = week_end.date().isoformat()
     if not (week_start_date <= log_date <= week_end_date):
         return
 
-    delta = _points_for_status(new_status) - _points_for_status(old_status)
-    delta += _streak_bonus_delta(old_status=old_status, new_status=new_status)
-    if delta == 0:
-        return
-
-    async with leaderboard_lock:
-        existing = await db.weekly_scores.find_one(
-            {"user_id": user_id, "week_start": week_start.isoformat(), "week_end": week_end.isoformat()},
-            {"_id": 0},
-        )
-        now_utc = datetime.now(timezone.utc).isoformat()
+    now_utc = datetime.now(timezone.utc).isoformat()
+    new_score = await _increment_weekly_score(user_id, week_start, week_end, delta, now_utc)
+    logger.info("Weekly score update: user=%s delta=%s score=%s", user_id, delta, new_score)
 
-        if not existing:
-            new_score = max(0, delta)
-            doc = {
-                "id": str(uuid.uuid4()),
-                "user_id": user_id,
-                "score": new_score,
-                "week_start": week_start.isoformat(),
-                "week_end": week_end.isoformat(),
-                "updated_at": now_utc,
-            }
-            await db.weekly_scores.insert_one(doc)
-            logger.info("Weekly score init: user=%s score=%s", user_id, new_score)
-            return
 
-        current_score = int(existing.get("score", 0))
-        new_score = max(0, current_score + delta)
-        await db.weekly_scores.update_one(
-            {"id": existing["id"]},
-            {"$set": {"score": new_score, "updated_at": now_utc}},
-        )
-        logger.info("Weekly score update: user=%s delta=%s score=%s", user_id, delta, new_score)
+_LEADERBOARD_INTERNAL_TOKEN = os.environ.get("LEADERBOARD_INTERNAL_TOKEN")
 
 
 def _require_internal_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> None:
-    expected = os.environ.get("LEADERBOARD_INTERNAL_TOKEN")
+    expected = _LEADERBOARD_INTERNAL_TOKEN
     if not expected:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Internal token not configured")
-    if credentials.credentials != expected:
+    # Constant-time compare so response timing doesn't leak how much of the token matched.
+    if not hmac.compare_digest(credentials.credentials.encode("utf-8"), expected.encode("utf-8")):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
 
 async def _scheduled_weekly_reset() -> None:
     async with leaderboard_lock:
         state = await _get_or_init_leaderboard_state()
-        try:
-            week_start = datetime.fromisoformat(state["week_start"]).astimezone(_get_leaderboard_tz())
-            week_end = datetime.fromisoformat(state["week_end"]).astimezone(_get_leaderboard_tz())
-        except Exception:
-            now = _now_lb()
-            week_start, week_end = _week_bounds(now)
+        week_start, week_end = _parse_week_state(state)
         await _run_weekly_reset_locked(week_start, week_end)
 
 
+# MongoDB's $toLower folds ASCII letters only; the file-backed ranking folds names the same
+# way so both backends order users alike.
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _leaderboard_name_key(name: Optional[str]) -> str:
+    return (name or "").translate(_ASCII_LOWER)
+
+
+async def _aggregate_weekly_leaderboard(
+    week_start: datetime,
+    week_end: datetime,
+    limit: int,
+    offset: int,
+    current_user: Dict[str, Any],
+) -> Tuple[List[LeaderboardEntry], Optional[LeaderboardEntry]]:
+    # Join, rank and paginate inside MongoDB so only the requested page (plus the caller's
+    # own ranked row) comes back, instead of every user and every score.
+    ws, we = week_start.isoformat(), week_end.isoformat()
+    me_id = current_user.get("id")
+
+    pipeline = [
+        {"$match": {"id": {"$nin": [None, ""]}}},
+        {"$lookup": {"from": "weekly_scores", "localField": "id", "foreignField": "user_id", "as": "scores"}},
+        {
+            "$project": {
+                "_id": 0,
+                "user_id": "$id",
+                "avatar_url": 1,
+                "name": {"$cond": [{"$eq": [{"$ifNull": ["$name", ""]}, ""]}, "User", "$name"]},
+                "week_score": {
+                    "$arrayElemAt": [
+                        {
+                            "$filter": {
+                                "input": "$scores",
+                                "cond": {"$and": [{"$eq": ["$$this.week_start", ws]}, {"$eq": ["$$this.week_end", we]}]},
+                            }
+                        },
+                        0,
+                    ]
+                },
+            }
+        },
+        {"$addFields": {"score": {"$ifNull": ["$week_score.score", 0]}, "name_key": {"$toLower": "$name"}}},
+        # Tie-breaker: name then id for stability. The caller's rank comes from the same
+        # ordering, so it never depends on how Python would fold their name.
+        {
+            "$setWindowFields": {
+                "sortBy": {"score": -1, "name_key": 1, "user_id": 1},
+                "output": {"rank": {"$documentNumber": {}}},
+            }
+        },
+        {
+            "$facet": {
+                "page": [{"$sort": {"rank": 1}}, {"$skip": offset}, {"$limit": limit}],
+                "me": [{"$match": {"user_id": me_id}}],
+            }
+        },
+    ]
+    rows = await db.users.aggregate(pipeline).to_list(1)
+    facets = rows[0] if rows else {}
+
+    def to_entry(r: Dict[str, Any]) -> LeaderboardEntry:
+        return LeaderboardEntry(
+            rank=int(r["rank"]),
+            user_id=r["user_id"],
+            name=r["name"],
+            score=int(r["score"]),
+            avatar_url=r.get("avatar_url"),
+        )
+
+    paged = [to_entry(r) for r in facets.get("page", [])]
+    me_rows = facets.get("me") or []
+    me_entry = to_entry(me_rows[0]) if me_rows else None
+    return paged, me_entry
+
+
 # ============== LEADERBOARD ROUTES ==============
 
 @api_router.get("/leaderboard/weekly", response_model=WeeklyLeaderboardResponse)
@@ -1280,47 +2083,49 @@ async def get_weekly_leaderboard(
     offset = max(0, offset)
 
     state = await _ensure_current_week()
-    week_start = datetime.fromisoformat(state["week_start"]).astimezone(_get_leaderboard_tz())
-    week_end = datetime.fromisoformat(state["week_end"]).astimezone(_get_leaderboard_tz())
-
-    users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(100000)
-    scores = await db.weekly_scores.find(
-        {"week_start": week_start.isoformat(), "week_end": week_end.isoformat()},
-        {"_id": 0},
-    ).to_list(100000)
-    score_by_user = {s.get("user_id"): int(s.get("score", 0)) for s in scores if s.get("user_id")}
+    week_start, week_end = state["week_start_dt"], state["week_end_dt"]
 
-    rows: List[Dict[str, Any]] = []
-    for u in users:
-        user_id = u.get("id")
-        if not user_id:
-            continue
-        rows.append(
-            {
-                "user_id": user_id,
-                "name": u.get("name") or "User",
-                "avatar_url": u.get("avatar_url"),
-                "score": score_by_user.get(user_id, 0),
-            }
-        )
+    if client is not None:
+        paged, me_entry = await _aggregate_weekly_leaderboard(week_start, week_end, limit, offset, current_user)
+    else:
+        users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(100000)
+        scores = await db.weekly_scores.find(
+            {"week_start": week_start.isoformat(), "week_end": week_end.isoformat()},
+            {"_id": 0},
+        ).to_list(100000)
+        score_by_user = {s.get("user_id"): int(s.get("score", 0)) for s in scores if s.get("user_id")}
+
+        rows: List[Dict[str, Any]] = []
+        for u in users:
+            user_id = u.get("id")
+            if not user_id:
+                continue
+            rows.append(
+                {
+                    "user_id": user_id,
+                    "name": u.get("name") or "User",
+                    "avatar_url": u.get("avatar_url"),
+                    "score": score_by_user.get(user_id, 0),
+                }
+            )
 
-    # Tie-breaker: name then id for stability.
-    rows.sort(key=lambda r: (-r["score"], (r["name"] or "").lower(), r["user_id"]))
-
-    entries_all: List[LeaderboardEntry] = []
-    for idx, r in enumerate(rows):
-        entries_all.append(
-            LeaderboardEntry(
-                rank=idx + 1,
-                user_id=r["user_id"],
-                name=r["name"],
-                score=r["score"],
-                avatar_url=r.get("avatar_url"),
+        # Tie-breaker: name then id for stability.
+        rows.sort(key=lambda r: (-r["score"], _leaderboard_name_key(r["name"]), r["user_id"]))
+
+        entries_all: List[LeaderboardEntry] = []
+        for idx, r in enumerate(rows):
+            entries_all.append(
+                LeaderboardEntry(
+                    rank=idx + 1,
+                    user_id=r["user_id"],
+                    name=r["name"],
+                    score=r["score"],
+                    avatar_url=r.get("avatar_url"),
+                )
             )
-        )
 
-    me_entry = next((e for e in entries_all if e.user_id == current_user.get("id")), None)
-    paged = entries_all[offset : offset + limit]
+        me_entry = next((e for e in entries_all if e.user_id == current_user.get("id")), None)
+        paged = entries_all[offset : offset + limit]
 
     return WeeklyLeaderboardResponse(
         week_start=week_start.isoformat(),
@@ -1337,12 +2142,17 @@ async def get_weekly_leaderboard(
 
 @api_router.get("/leaderboard/countdown", response_model=LeaderboardCountdownResponse)
 async def get_leaderboard_countdown(current_user: dict = Depends(get_current_user)):
-    state = await _ensure_current_week()
-    now = _now_lb()
-
-    week_end = datetime.fromisoformat(state["week_end"]).astimezone(_get_leaderboard_tz())
-    day_end = _day_end(now)
-    month_end = _month_end(now)
+    # Pure computation: the cached week when it is still current, otherwise the calendar week.
+    # Rollover after a missed reset is left to the endpoints that read or write scores.
+    tz = _get_leaderboard_tz()
+    now = _now_lb(tz)
+    state = _week_state
+    if state is not None and _week_state_until is not None and now < _week_state_until:
+        week_end = state["week_end_dt"]
+    else:
+        week_end = _week_bounds(now, tz)[1]
+    day_end = _day_end(now, tz)
+    month_end = _month_end(now, tz)
 
     def remaining_seconds(target: datetime) -> int:
         seconds = int((target - now).total_seconds())
@@ -1364,48 +2174,17 @@ async def get_leaderboard_countdown(current_user: dict = Depends(get_current_use
 async def update_score_internal(payload: UpdateScoreRequest, _: None = Depends(_require_internal_token)):
     # Internal-only endpoint. Do not expose LEADERBOARD_INTERNAL_TOKEN to clients.
     state = await _ensure_current_week()
-    week_start = datetime.fromisoformat(state["week_start"]).astimezone(_get_leaderboard_tz())
-    week_end = datetime.fromisoformat(state["week_end"]).astimezone(_get_leaderboard_tz())
+    week_start, week_end = state["week_start_dt"], state["week_end_dt"]
     now_utc = datetime.now(timezone.utc).isoformat()
 
-    async with leaderboard_lock:
-        existing = await db.weekly_scores.find_one(
-            {"user_id": payload.user_id, "week_start": week_start.isoformat(), "week_end": week_end.isoformat()},
-            {"_id": 0},
-        )
-
-        if not existing:
-            new_score = max(0, payload.delta)
-            doc = {
-                "id": str(uuid.uuid4()),
-                "user_id": payload.user_id,
-                "score": new_score,
-                "week_start": week_start.isoformat(),
-                "week_end": week_end.isoformat(),
-                "updated_at": now_utc,
-            }
-            await db.weekly_scores.insert_one(doc)
-            return UpdateScoreResponse(
-                user_id=payload.user_id,
-                week_start=week_start.isoformat(),
-                week_end=week_end.isoformat(),
-                score=new_score,
-                updated_at=now_utc,
-            )
-
-        current_score = int(existing.get("score", 0))
-        new_score = max(0, current_score + payload.delta)
-        await db.weekly_scores.update_one(
-            {"id": existing["id"]},
-            {"$set": {"score": new_score, "updated_at": now_utc}},
-        )
-        return UpdateScoreResponse(
-            user_id=payload.user_id,
-            week_start=week_start.isoformat(),
-            week_end=week_end.isoformat(),
-            score=new_score,
-            updated_at=now_utc,
-        )
+    new_score = await _increment_weekly_score(payload.user_id, week_start, week_end, payload.delta, now_utc)
+    return UpdateScoreResponse(
+        user_id=payload.user_id,
+        week_start=week_start.isoformat(),
+        week_end=week_end.isoformat(),
+        score=new_score,
+        updated_at=now_utc,
+    )
 
 
 @api_router.get("/leaderboard/history")
@@ -1416,12 +2195,17 @@ async def get_leaderboard_history(
 ):
     limit = max(1, min(100, limit))
     offset = max(0, offset)
-    items = await db.weekly_history.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(100000)
-    items.sort(key=lambda d: d.get("week_end") or "", reverse=True)
+    items = await (
+        db.weekly_history.find({"user_id": current_user["id"]}, {"_id": 0})
+        .sort("week_end", -1)
+        .skip(offset)
+        .limit(limit)
+        .to_list(limit)
+    )
     return {
         "limit": limit,
         "offset": offset,
-        "entries": items[offset : offset + limit],
+        "entries": items,
     }
 
 # ============== BASIC ROUTES ==============
@@ -1460,6 +2244,26 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+_MONGO_INDEXES: List[Tuple[str, List[Tuple[str, int]], Dict[str, Any]]] = [
+    # Analytics and score updates filter logs by user + date range, then status; habit_id is
+    # appended so the analytics projection is covered by the index.
+    ("habit_logs", [("user_id", 1), ("date", 1), ("status", 1), ("habit_id", 1)], {}),
+    # The rollup rebuild's $merge matches on these fields and requires this unique index.
+    ("user_habit_daily", [("user_id", 1), ("date", 1), ("status", 1)], {"unique": True}),
+    ("weekly_scores", [("user_id", 1), ("week_start", 1), ("week_end", 1)], {"unique": True}),
+    ("weekly_history", [("user_id", 1), ("week_end", -1)], {}),
+]
+
+async def _ensure_mongo_indexes() -> None:
+    # Each index on its own: one failure (e.g. existing duplicates blocking a unique index)
+    # must not leave the others missing.
+    for collection, keys, options in _MONGO_INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            logger.warning("Could not create MongoDB index on %s (%s).", collection, str(e))
+
+
 @app.on_event("startup")
 async def startup_db_client():
     global client, db, leaderboard_scheduler
@@ -1482,10 +2286,14 @@ async def startup_db_client():
             logger.warning("MongoDB not available (%s). Falling back to file-backed DB.", str(e))
             client = None
 
+    if client is not None:
+        await _ensure_mongo_indexes()
+
     if db is None:
         data_file = os.environ.get("DATA_FILE")
         path = Path(data_file) if data_file else (ROOT_DIR / "data" / "db.json")
-        db = FileBackedDB(path)
+        flush_ms = os.environ.get("DATA_FILE_FLUSH_MS")
+        db = FileBackedDB(path, flush_delay=float(flush_ms) / 1000 if flush_ms else 0.05)
         logger.warning("Using file-backed DB at %s (data persists between restarts).", str(path))
 
     # Ensure leaderboard state exists and schedule weekly reset.
@@ -1502,6 +2310,17 @@ async def startup_db_client():
             coalesce=True,
             misfire_grace_time=3600,
         )
+        if client is not None:
+            # Runs once right away (backfill) and then nightly to correct any drift.
+            leaderboard_scheduler.add_job(
+                _rebuild_daily_rollup,
+                CronTrigger(hour=3, minute=30, timezone=tz),
+                id="daily_rollup_rebuild",
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True,
+                next_run_time=datetime.now(tz),
+            )
         leaderboard_scheduler.start()
         logger.info("Leaderboard scheduler started (weekly reset: Sunday 23:59 %s)", LEADERBOARD_TZ or "UTC")
 
@@ -1514,5 +2333,7 @@ async def shutdown_db_client():
         except Exception:
             pass
         leaderboard_scheduler = None
+    if isinstance(db, FileBackedDB):
+        await db.flush()
     if client is not None:
         client.close()